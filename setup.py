@@ -12,6 +12,7 @@ requirements = [
     'lxml == 4.1.1',
     'sqlalchemy',
     'pycrypto == 2.6.1',
+    'cryptography',
     'python-telegram-bot == 8.1.1',
     'coloredlogs'
 ]
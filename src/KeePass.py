@@ -1,24 +1,79 @@
 import base64
+import bisect
 import datetime
+import functools
 import logging
-import math
-import uuid as uuid_generator
+import os
+import secrets
+import string
 from abc import ABC
 from enum import Enum
 from io import BytesIO
 
 import libkeepass
-from lxml import etree
-from lxml import objectify
-from lxml.etree import Element, SubElement
+from lxml.builder import ElementMaker
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
-from src.lib.db import save_object
-from src.models import User, DBSession
+import src.lib.kdbx  # registers KDB4 reader which caches master key
+from src.lib.db import get_user, update_object
 from src.settings import NUMBER_OF_ENTRIES_ON_PAGE, lock_emo, arrow_up_emo, arrow_left_emo, arrow_right_emo, black_x_emo, x_emo, repeat_emo, pencil_emo, arrow_down_emo, back_emo, new_line, key_emo, folder_emo
 
 logger = logging.getLogger(__name__)
 
+PASSWORD_CHARSET = string.ascii_letters + string.digits
+PASSWORD_LENGTH = 8
+# None values give empty elements, numbers are written as text
+E = ElementMaker(typemap={type(None): lambda elem, value: None,
+                          int: lambda elem, value: str(value)})
+
+# joins names for search, word without it never matches across two names
+NAME_SEPARATOR = "\x01"
+
+# Buttons which never change are built once, telegram only reads them on send
+NAVIGATION_ROW = [InlineKeyboardButton(text=arrow_left_emo, callback_data="Left"),
+                  InlineKeyboardButton(text=arrow_up_emo, callback_data="Back"),
+                  InlineKeyboardButton(text=lock_emo, callback_data="Lock"),
+                  InlineKeyboardButton(text=arrow_right_emo, callback_data="Right")]
+DELETE_CONFIRM_ROW = [InlineKeyboardButton(text="Yes, I am sure" + x_emo, callback_data="ReallyDelete"),
+                      InlineKeyboardButton(text="No, keep it" + back_emo, callback_data="NoDelete")]
+RESEND_BUTTON = InlineKeyboardButton(text=repeat_emo, callback_data="Resend")
+DOWNLOAD_BUTTON = InlineKeyboardButton(text=arrow_down_emo, callback_data="Download")
+DELETE_BUTTON = InlineKeyboardButton(text=x_emo, callback_data="Delete")
+ROOT_DELETE_BUTTON = InlineKeyboardButton(text=black_x_emo, callback_data="Nothing")
+ADD_EDIT_NAVIGATION_ROW = [InlineKeyboardButton(text=arrow_left_emo, callback_data="create_Left"),
+                           InlineKeyboardButton(text=arrow_up_emo, callback_data="create_Back"),
+                           InlineKeyboardButton(text=lock_emo, callback_data="Lock"),
+                           InlineKeyboardButton(text=arrow_right_emo, callback_data="create_Right")]
+ADD_EDIT_DONE_ROW = [InlineKeyboardButton(text="---Done---", callback_data="create_done")]
+
+UUID_SIZE = 16
+UUID_BATCH = 64
+_uuid_pool = []
+
+
+def new_uuid():
+    """
+    Base64 uuid for new item, random bytes are read once per batch
+    :return: str
+    """
+    if not _uuid_pool:
+        random_bytes = os.urandom(UUID_SIZE * UUID_BATCH)
+        _uuid_pool.extend(base64.b64encode(random_bytes[offset:offset + UUID_SIZE]).decode("utf-8")
+                          for offset in range(0, len(random_bytes), UUID_SIZE))
+    return _uuid_pool.pop()
+
+
+def get_xml_times():
+    nowdate = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return E.Times(E.CreationTime(nowdate),
+                   E.LastModificationTime(nowdate),
+                   E.LastAccessTime(nowdate),
+                   E.ExpiryTime(nowdate),
+                   E.Expires("False"),
+                   E.UsageCount("0"),
+                   E.LocationChanged(nowdate))
+
+
 class ItemType(Enum):
     GROUP = "Group"
     ENTRY = "Entry"
@@ -36,16 +91,44 @@ class ProcessType(Enum):
 
 
 class BaseKeePass(ABC):
+    # really_delete is set by interface handlers before deleting confirmation
+    __slots__ = ('_root', '_parent', '_name', '_dirty', 'page', 'size', 'type', 'really_delete')
 
     def __init__(self, root, parent):
         self._root = root
         self._parent = parent
+        self._name = ""
+        self._dirty = False
         self.page = 1
         self.size = 0
         self.type = None
 
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._name = value
+        self._root.invalidate_name_index()
+        if self._parent is not None:
+            self._parent.update_item_name(self)
+
+    def update_item_name(self, item):
+        pass
+
+    def pages_count(self):
+        return max(-(-self.size // NUMBER_OF_ENTRIES_ON_PAGE), 1)
+
+    def get_page_slice(self):
+        start = (self.page - 1) * NUMBER_OF_ENTRIES_ON_PAGE
+        return slice(start, start + NUMBER_OF_ENTRIES_ON_PAGE)
+
+    def get_page_items(self):
+        return self.items[self.get_page_slice()]
+
     def next_page(self):
-        if self.page < self.size / NUMBER_OF_ENTRIES_ON_PAGE:
+        if self.page < self.pages_count():
             self.page += 1
         else:
             self.page = 1
@@ -54,7 +137,19 @@ class BaseKeePass(ABC):
         if self.page > 1:
             self.page -= 1
         else:
-            self.page = int(math.ceil(self.size / NUMBER_OF_ENTRIES_ON_PAGE))
+            self.page = self.pages_count()
+
+    def mark_dirty(self):
+        """
+        Marking item to be rebuilt in xml tree on next database save
+        :return: None
+        """
+        if not self._dirty:
+            self._dirty = True
+            self._root.add_dirty_item(self)
+
+    def clean(self):
+        self._dirty = False
 
     def activate(self):
         self._root.active_item = self
@@ -83,6 +178,12 @@ class KeePass:
         self.opened = False
         self.add_edit_state = None
         self._root_obj = None
+        self._xml_index = {}
+        self._dirty_items = []
+        self._by_uuid = {}
+        self._name_index = None
+        self._name_corpus = ""
+        self._name_offsets = []
         self.root_group = None
         self.search_group = None
         self.user = None
@@ -93,21 +194,50 @@ class KeePass:
             raise IOError("Databse not opened")
         return str(self.root_group)
 
-    def generate_root(self):
-        base = Element("KeePassFile")
-
-        meta = self._root_obj.find("Meta")
-        base.append(meta)
-
-        root = Element("Root")
-        root.append(self.root_group.get_xml_element())
-        SubElement(root, "DeletedObjects")
-
-        base.append(root)
-
-        # print(etree.tounicode(base_el, pretty_print=True))
-
-        self._root_obj = objectify.fromstring(etree.tounicode(base), objectify.makeparser())
+    def generate_root(self, dirty, removed=()):
+        """
+        Sync changed items into opened xml tree in place
+        :param dirty: KeeGroup/KeeEntry items which elements must be rebuilt
+        :param removed: deleted KeeGroup/KeeEntry items
+        :return: None
+        """
+        for item in removed:
+            item_obj = self._xml_index.get(item.uuid)
+            if item_obj is not None:
+                self._unindex_xml_element(item_obj)
+                item_obj.getparent().remove(item_obj)
+
+        for item in dirty:
+            # item not from database tree (e.g. search results) or already deleted
+            if not self.has_item(item):
+                continue
+            old_obj = self._xml_index.get(item.uuid)
+            if old_obj is None:
+                new_obj = item.get_xml_element()
+                self._xml_index[item.get_parent().uuid].append(new_obj)
+                self._index_xml_element(new_obj)
+                continue
+
+            if item.type == ItemType.GROUP:
+                # children are not changed with group, move their elements over by reference
+                new_obj = item.get_xml_element(with_items=False)
+                new_obj.extend(list(old_obj.iterchildren('Group', 'Entry')))
+            else:
+                new_obj = item.get_xml_element()
+            old_obj.getparent().replace(old_obj, new_obj)
+            self._xml_index[item.uuid] = new_obj
+
+    def _index_xml_element(self, element):
+        for item_obj in element.iter('Group', 'Entry'):
+            # skip entries stored in <History>
+            if item_obj is element or item_obj.getparent().tag == 'Group':
+                self._xml_index[item_obj.findtext('UUID')] = item_obj
+
+    def _unindex_xml_element(self, element):
+        for item_obj in element.iter('Group', 'Entry'):
+            uuid = item_obj.findtext('UUID')
+            if self._xml_index.get(uuid) is item_obj:
+                del self._xml_index[uuid]
 
     def get_user(self):
         return self.user
@@ -116,68 +246,80 @@ class KeePass:
         if not self.opened:
             raise IOError("Databse not opened")
 
-        def inner_init(parent_group_obj, cur_group):
-            for item in parent_group_obj.findall('Group') + parent_group_obj.findall('Entry'):
-                if item.tag == str(ItemType.GROUP):
-                    new_group = KeeGroup(root=self, parent=cur_group, name=item.Name.text, notes=item.Notes.text, icond_id=item.IconID.text, uuid=item.UUID.text)
-                    cur_group.append(new_group)
-                    inner_init(item, new_group)
-                if item.tag == str(ItemType.ENTRY):
-                    asoc = None
-                    if hasattr(item.AutoType, 'Association'):
-                        asoc = {'window': item.AutoType.Association.Window.text,
-                                'key_sec': item.AutoType.Association.KeystrokeSequence.text}
-                    autotype = AutoType(enabled=item.AutoType.Enabled.text, dto=item.AutoType.DataTransferObfuscation.text, association=asoc)
-                    new_entry = KeeEntry(root=self, parent=cur_group, icond_id=item.IconID.text, uuid=item.UUID.text, autotype=autotype)
-                    for string in item.findall('String'):
-                        new_entry.append(EntryString(root=self, parent=new_entry, key=string.Key.text, value=string.Value.text))
-                    cur_group.append(new_entry)
-
         root_group_obj = self._root_obj.find('./Root/Group')
-        self.root_group = KeeGroup(root=self, parent=None, name=root_group_obj.Name.text, notes=root_group_obj.Notes.text, icond_id=root_group_obj.IconID.text, uuid=root_group_obj.UUID.text)
-        inner_init(root_group_obj, self.root_group)
-        pass
+
+        """Groups come in document order, so parent is always created before its children"""
+        groups = {}
+        for group_obj in root_group_obj.iter('Group'):
+            parent_group = groups.get(group_obj.getparent())
+            new_group = KeeGroup(root=self, parent=parent_group, name=group_obj.findtext('Name'), notes=group_obj.findtext('Notes', ''),
+                                 icond_id=group_obj.findtext('IconID'), uuid=group_obj.findtext('UUID'))
+            if parent_group is None:
+                self.root_group = new_group
+                self.register_item(new_group)
+            else:
+                parent_group.append(new_group)
+            groups[group_obj] = new_group
+            self._xml_index[new_group.uuid] = group_obj
+
+        for entry_obj in root_group_obj.iter('Entry'):
+            parent_group = groups.get(entry_obj.getparent())
+            # entries inside <History> are old versions, not group items
+            if parent_group is None:
+                continue
+
+            autotype_obj = entry_obj.find('AutoType')
+            asoc = None
+            asoc_obj = autotype_obj.find('Association')
+            if asoc_obj is not None:
+                asoc = {'window': asoc_obj.findtext('Window'),
+                        'key_sec': asoc_obj.findtext('KeystrokeSequence')}
+            autotype = AutoType(enabled=autotype_obj.findtext('Enabled'), dto=autotype_obj.findtext('DataTransferObfuscation'), association=asoc)
+            new_entry = KeeEntry(root=self, parent=parent_group, icond_id=entry_obj.findtext('IconID'), uuid=entry_obj.findtext('UUID'), autotype=autotype)
+            for string_obj in entry_obj.iterchildren('String'):
+                # one pass over Key/Value, findtext() goes through ElementPath for each of them
+                key = value = None
+                for field_obj in string_obj.iterchildren():
+                    if field_obj.tag == 'Key':
+                        key = field_obj.text or ''
+                    elif field_obj.tag == 'Value':
+                        value = field_obj.text or ''
+                new_entry.append(EntryString(root=self, parent=new_entry, key=key, value=value))
+            parent_group.append(new_entry)
+            self._xml_index[new_entry.uuid] = entry_obj
 
     def _generate_keyboard(self):
         if not self.opened:
             raise IOError("Databse not opened")
 
-        message_buttons = [[InlineKeyboardButton(text=arrow_left_emo, callback_data="Left"),
-                            InlineKeyboardButton(text=arrow_up_emo, callback_data="Back"),
-                            InlineKeyboardButton(text=lock_emo, callback_data="Lock"),
-                            InlineKeyboardButton(text=arrow_right_emo, callback_data="Right")]]
+        message_buttons = [NAVIGATION_ROW]
         if self.active_item == self.root_group:
-            delete_but = InlineKeyboardButton(text=black_x_emo, callback_data="Nothing")
+            delete_but = ROOT_DELETE_BUTTON
         else:
-            delete_but = InlineKeyboardButton(text=x_emo, callback_data="Delete")
+            delete_but = DELETE_BUTTON
         second_row = \
             [InlineKeyboardButton(text=pencil_emo, callback_data=f"Edit_{self.active_item.uuid}"),
-             InlineKeyboardButton(text=repeat_emo, callback_data="Resend"),
-             InlineKeyboardButton(text=arrow_down_emo, callback_data="Download"),
+             RESEND_BUTTON,
+             DOWNLOAD_BUTTON,
              delete_but]
 
         if self.active_item and self.active_item.type == ItemType.ENTRY:
             if getattr(self.active_item, 'really_delete', False):
-                message_buttons.append([InlineKeyboardButton(text="Yes, I am sure" + x_emo, callback_data="ReallyDelete"),
-                                        InlineKeyboardButton(text="No, keep it" + back_emo, callback_data="NoDelete")])
+                message_buttons.append(DELETE_CONFIRM_ROW)
             elif not self.search_group:
                 message_buttons.append(second_row)
             InlineKeyboardMarkup(message_buttons)
         else:
-            i = 0
             if self.active_item != self.root_group:
                 if getattr(self.active_item, 'really_delete', False):
-                    message_buttons.append([InlineKeyboardButton(text="Yes, I am sure" + x_emo, callback_data="ReallyDelete"),
-                                            InlineKeyboardButton(text="No, keep it" + back_emo, callback_data="NoDelete")])
+                    message_buttons.append(DELETE_CONFIRM_ROW)
                 elif not self.search_group:
                     message_buttons.append(second_row)
             elif not self.search_group:
                 message_buttons.append(second_row)
 
-            for item in self.active_item.items:
-                if self.active_item.page * NUMBER_OF_ENTRIES_ON_PAGE >= i >= self.active_item.page * NUMBER_OF_ENTRIES_ON_PAGE - NUMBER_OF_ENTRIES_ON_PAGE:
-                    message_buttons.append([InlineKeyboardButton(text=str(item), callback_data=item.uuid)])
-                i += 1
+            message_buttons.extend([InlineKeyboardButton(text=item_name, callback_data=item_uuid)]
+                                   for _, item_name, item_uuid in self.active_item.get_page_rows())
 
         return InlineKeyboardMarkup(message_buttons)
 
@@ -186,19 +328,17 @@ class KeePass:
 
     def open(self, chat_id, password=None, keyfile_path=None):
 
-        self.user = DBSession.query(User).filter(User.chat_id == chat_id).first()
+        self.user = get_user(chat_id)
 
         try:
-            with libkeepass.open(filename=self.path, password=password, keyfile=keyfile_path, unprotect=False) as kdb:
-                self.kdb = kdb
-                self.user.is_opened = True
-                save_object(self.user)
-                self._root_obj = kdb.obj_root
-                # print(etree.tounicode(self._root_obj, pretty_print=True))
+            self.kdb = self._open_blocking(password, keyfile_path)
+            update_object(self.user, is_opened=True)
+            self._root_obj = self.kdb.obj_root
+            # print(etree.tounicode(self._root_obj, pretty_print=True))
 
-                self.opened = True
-                self._init_root_group()
-                self.root_group.activate()
+            self.opened = True
+            self._init_root_group()
+            self.root_group.activate()
 
         except IOError as e:
             logger.error(str(e))
@@ -206,6 +346,14 @@ class KeePass:
         except UnicodeDecodeError:
             raise IOError("Critical error, please report to administrator.")
 
+    def _open_blocking(self, password=None, keyfile_path=None):
+        """
+        Reading, key transformation and decryption of database file, the slow part of open
+        :return: opened kdb
+        """
+        with libkeepass.open(filename=self.path, password=password, keyfile=keyfile_path, unprotect=False) as kdb:
+            return kdb
+
     def get_message(self):
         if not self.opened:
             raise IOError("Database not opened")
@@ -215,79 +363,105 @@ class KeePass:
 
         if active_item.type == ItemType.ENTRY:
             message_text += "_______" + key_emo + active_item.name + "_______" + new_line
-            i = 0
-            for item in active_item.items:
-                if active_item.page * NUMBER_OF_ENTRIES_ON_PAGE >= i >= active_item.page * NUMBER_OF_ENTRIES_ON_PAGE - NUMBER_OF_ENTRIES_ON_PAGE:
-                    try:
-                        message_text += str(item) + new_line
-                    except TypeError:
-                        continue
-                i += 1
-            if i > NUMBER_OF_ENTRIES_ON_PAGE:
-                message_text += "_______Page {0} of {1}_______".format(active_item.page, int(
-                    math.ceil(active_item.size / NUMBER_OF_ENTRIES_ON_PAGE))) + new_line
-            else:
-                message_text += "_______Page {0} of {1}_______".format(active_item.page, 1) + new_line
+            for item in active_item.get_page_items():
+                try:
+                    message_text += str(item) + new_line
+                except TypeError:
+                    continue
 
         if active_item.type == ItemType.GROUP:
-
             message_text += "_______" + str(active_item) + "_______" + new_line
-            i = 0
-            for item in active_item.items:
-                if active_item.page * NUMBER_OF_ENTRIES_ON_PAGE >= i >= active_item.page * NUMBER_OF_ENTRIES_ON_PAGE - NUMBER_OF_ENTRIES_ON_PAGE:
-                    if item.type == ItemType.ENTRY:
-                        message_text += key_emo + str(item) + new_line
-                    if item.type == ItemType.GROUP:
-                        message_text += folder_emo + str(item) + new_line
-                i += 1
-            if i > NUMBER_OF_ENTRIES_ON_PAGE:
-                message_text += "_______Page {0} of {1}_______".format(active_item.page, int(
-                    math.ceil(active_item.size / NUMBER_OF_ENTRIES_ON_PAGE))) + new_line
-            else:
-                message_text += "_______Page {0} of {1}_______".format(active_item.page, 1) + new_line
+            for item_type, item_name, _ in active_item.get_page_rows():
+                if item_type == ItemType.ENTRY:
+                    message_text += key_emo + item_name + new_line
+                if item_type == ItemType.GROUP:
+                    message_text += folder_emo + item_name + new_line
+
+        message_text += "_______Page {0} of {1}_______".format(active_item.page, active_item.pages_count()) + new_line
 
         message_markup = self._generate_keyboard()
 
         return message_text, message_markup
 
+    def register_item(self, item):
+        """
+        Adding KeeGroup/KeeEntry to uuid and search indexes
+        :param item: KeeGroup or KeeEntry from database tree
+        :return: None
+        """
+        self._by_uuid[item.uuid] = item
+        self._name_index = None
+
+    def unregister_item(self, item):
+        """
+        Removing KeeGroup/KeeEntry with all its children from uuid and search indexes
+        :param item: KeeGroup or KeeEntry from database tree
+        :return: None
+        """
+        items = [item]
+        while items:
+            item = items.pop()
+            if self._by_uuid.get(item.uuid) is item:
+                del self._by_uuid[item.uuid]
+            if item.type == ItemType.GROUP:
+                items.extend(item.items)
+        self._name_index = None
+
+    def add_dirty_item(self, item):
+        self._dirty_items.append(item)
+
+    def has_item(self, item):
+        return self._by_uuid.get(item.uuid) is item
+
+    def invalidate_name_index(self):
+        self._name_index = None
+
     def search_item(self, word):
         if not self.opened:
             raise IOError("Databse not opened")
 
-        finded_items = []
-
-        def __inner_find(parent_item):
-            if word.lower() in parent_item.name.lower():
-                finded_items.append(parent_item)
-            for item in parent_item.items:
-                if item.type == ItemType.GROUP:
-                    __inner_find(item)
-                if word.lower() in item.name.lower():
-                    finded_items.append(item)
+        if self._name_index is None:
+            self._build_name_index()
+        if not self._name_index:
+            return []
 
-        __inner_find(self.root_group)
+        """Scan all names at once, every match is resolved to its item by name offset"""
+        finded_items = []
+        word = word.lower()
+        if NAME_SEPARATOR in word:
+            return finded_items
+        last = len(self._name_index) - 1
+        pos = self._name_corpus.find(word)
+        while pos >= 0:
+            i = bisect.bisect_right(self._name_offsets, pos) - 1
+            finded_items.append(self._name_index[i])
+            if i == last:
+                break
+            pos = self._name_corpus.find(word, self._name_offsets[i + 1])
 
         return finded_items
 
+    def _build_name_index(self):
+        self._name_index = list(self._by_uuid.values())
+        names = [(item.name or "").lower() for item in self._name_index]
+        self._name_offsets = []
+        offset = 0
+        for name in names:
+            self._name_offsets.append(offset)
+            offset += len(name) + 1
+        self._name_corpus = NAME_SEPARATOR.join(names)
+
     def get_item_by_uuid(self, word):
         if not self.opened:
             raise IOError("Databse not opened")
 
-        def __inner_find(parent_item):
-            if parent_item.uuid == word:
-                return parent_item
-            for item in parent_item.items:
-                if item.type == ItemType.GROUP:
-                    finded_elem = __inner_find(item)
-                    if finded_elem:
-                        return finded_elem
+        if self.search_group:
+            for item in [self.search_group] + self.search_group.items:
                 if item.uuid == word:
                     return item
+            return None
 
-        if self.search_group:
-            return __inner_find(self.search_group)
-        else:
-            return __inner_find(self.root_group)
+        return self._by_uuid.get(word)
 
     def search(self, word):
         finded_items = self.search_item(word)
@@ -324,9 +498,11 @@ class KeePass:
                     for key, value in self.add_edit_state.get_rawstrings():
                         entry.append(EntryString(root=self, parent=entry, key=key, value=value))
                     group_item.append(entry)
+                    entry.mark_dirty()
 
                 elif process_type == ProcessType.EDIT:
                     entry = self.active_item
+                    # changed strings mark entry dirty by themselves
                     for key, value in self.add_edit_state.get_rawstrings():
                         entry.update_item(key, value)
 
@@ -339,6 +515,7 @@ class KeePass:
                 if process_type == ProcessType.ADD:
                     group = KeeGroup(root=self, parent=group_item, name=gr_name)
                     group_item.append(group)
+                    group.mark_dirty()
 
                 elif process_type == ProcessType.EDIT:
                     group = self.active_item
@@ -347,6 +524,7 @@ class KeePass:
                             group.name = value
                         if key == 'Note':
                             group.notes = value
+                    group.mark_dirty()
 
             group_item.activate()
 
@@ -354,22 +532,26 @@ class KeePass:
 
         self.add_edit_state = None
 
-    def update_kdb_in_db(self):
-        self.generate_root()
-        self.kdb.obj_root = self._root_obj
+    def update_kdb_in_db(self, removed=()):
+        dirty = self._dirty_items
+        self._dirty_items = []
+        for item in dirty:
+            item.clean()
+
+        """Nothing changed, skip re-encryption"""
+        if not dirty and not removed:
+            return
 
-        # print(etree.tounicode(self._root_obj, pretty_print=True))
+        self.generate_root(dirty, removed)
 
         """Write to new memory file"""
         output = BytesIO()
         self.kdb.write_to(output)
-        output.name = self.root_group.name + '.kdbx'
-        output.seek(0)
+        # write_to protects values in place, keep tree in clear for next save
+        self.kdb.unprotect()
 
-        """Saving to database"""
-        user = self.get_user()
-        user.file = output.getvalue()
-        save_object(user)
+        """Saving to database, driver reads buffer directly without copying it to bytes"""
+        update_object(self.get_user(), file=output.getbuffer())
 
 
 class AddEditState:
@@ -443,11 +625,7 @@ class AddEditState:
             prev_field = field
 
     def generate_password(self):
-        from random import sample as rsample
-
-        s = "abcdefghijklmnopqrstuvwxyz01234567890ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-        passlen = 8
-        gen_password = "".join(rsample(s, passlen))
+        gen_password = "".join(secrets.choice(PASSWORD_CHARSET) for _ in range(PASSWORD_LENGTH))
 
         prev_field = self.current_field
         self.set_cur_field("Password")
@@ -472,12 +650,19 @@ class AddEditState:
         return message_text
 
     def _generate_keyboard(self):
-        message_buttons = [[InlineKeyboardButton(text=arrow_left_emo, callback_data="create_Left"),
-                            InlineKeyboardButton(text=arrow_up_emo, callback_data="create_Back"),
-                            InlineKeyboardButton(text=lock_emo, callback_data="Lock"),
-                            InlineKeyboardButton(text=arrow_right_emo, callback_data="create_Right")]]
+        return self._get_fields_keyboard(tuple(self.fields.keys()))
 
-        for field in self.fields.keys():
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _get_fields_keyboard(fields):
+        """
+        Keyboard depends only on field names, so it is built once per item type
+        :param fields: tuple of field names
+        :return: InlineKeyboardMarkup
+        """
+        message_buttons = [ADD_EDIT_NAVIGATION_ROW]
+
+        for field in fields:
             if field == "Password":
                 message_buttons.append([InlineKeyboardButton(text=field, callback_data=f"create_{field}"),
                                         InlineKeyboardButton(text="Generate",
@@ -485,26 +670,33 @@ class AddEditState:
             else:
                 message_buttons.append([InlineKeyboardButton(text=field, callback_data=f"create_{field}")])
 
-        message_buttons.append([InlineKeyboardButton(text="---Done---", callback_data="create_done")])
+        message_buttons.append(ADD_EDIT_DONE_ROW)
 
         return InlineKeyboardMarkup(message_buttons)
 
 
 class KeeGroup(BaseKeePass):
-    def __init__(self, root, parent, name, notes="", icond_id='37', uuid=""):
+    __slots__ = ('uuid', 'notes', 'icon_id', '_names', '_uuids', '_types', '_children')
+
+    def __init__(self, root, parent, name, notes="", icond_id='37', uuid=None):
         if parent is None:
             parent = self
         super().__init__(root, parent)
         if not uuid:
-            self.uuid = (base64.b64encode(uuid_generator.uuid4().bytes)).decode("utf-8")
+            self.uuid = new_uuid()
         else:
             self.uuid = uuid
 
         self.type = ItemType.GROUP
-        self.name = name
+        # items are kept as parallel lists, page render reads names and types without touching items
+        self._names = []
+        self._uuids = []
+        self._types = []
+        self._children = []
+        # name setter notifies parent, new group is not its child yet
+        self._name = name
         self.notes = notes
         self.icon_id = int(icond_id)
-        self.items = []
         self.size = 0
 
     def __str__(self):
@@ -521,91 +713,84 @@ class KeeGroup(BaseKeePass):
         """
         if not isinstance(item, KeeEntry) and not isinstance(item, KeeGroup):
             raise TypeError("KeeGroup accepts only KeeEntry or KeeGroup items")
-        self.items.append(item)
+        self._names.append(str(item))
+        self._uuids.append(item.uuid)
+        self._types.append(item.type)
+        self._children.append(item)
         self.size += 1
+        # search group holds copies, keep them out of database indexes
+        if self._root.has_item(self):
+            self._root.register_item(item)
 
-    def get_xml_element(self):
-        group = Element("Group")
-
-        uuid_el = SubElement(group, 'UUID')
-        uuid_el.text = self.uuid
-
-        name_el = SubElement(group, 'Name')
-        name_el.text = self.name
-
-        notes = SubElement(group, 'Notes')
-        notes.text = ""
-
-        icon_id = SubElement(group, 'IconID')
-        icon_id.text = str(self.icon_id)
-
-        # ------Times
-        times = SubElement(group, "Times")
-
-        nowdate = datetime.datetime.now()
-
-        cr_time = SubElement(times, "CreationTime")
-        cr_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        lm_time = SubElement(times, "LastModificationTime")
-        lm_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        la_time = SubElement(times, "LastAccessTime")
-        la_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        et_time = SubElement(times, "ExpiryTime")
-        et_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        expires = SubElement(times, "Expires")
-        expires.text = "False"
-
-        usage_count = SubElement(times, "UsageCount")
-        usage_count.text = "0"
-
-        lch_time = SubElement(times, "LocationChanged")
-        lch_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-        # Times-------------------
-
-        is_expanded = SubElement(group, "IsExpanded")
-        is_expanded.text = 'True'
-
-        # Autotype -----------
-        default_autotype_seq = SubElement(group, "DefaultAutoTypeSequence")
-        default_autotype_seq.text = ''
-        enable_at = SubElement(group, "EnableAutoType")
-        enable_at.text = "null"
-
-        # Searching -----------
-        enable_searching = SubElement(group, "EnableSearching")
-        enable_searching.text = "null"
+    def remove(self, item):
+        """
+        Removing entry or group from group
+        :param item: KeeEntry or KeeGroup of this group
+        :return: None
+        """
+        i = self._children.index(item)
+        del self._names[i]
+        del self._uuids[i]
+        del self._types[i]
+        del self._children[i]
+        self.size -= 1
+
+    def update_item_name(self, item):
+        try:
+            i = self._uuids.index(item.uuid)
+        except ValueError:
+            return
+        if self._children[i] is item:
+            self._names[i] = str(item)
 
-        last_top_vis_entry = SubElement(group, "LastTopVisibleEntry")
-        last_top_vis_entry.text = "AAAAAAAAAAAAAAAAAAAAAA=="
+    @property
+    def items(self):
+        return self._children
 
-        for item in self.items:
-            group.append(item.get_xml_element())
+    def get_page_rows(self):
+        """
+        Items of current page
+        :return: (type, name, uuid) tuples
+        """
+        page = self.get_page_slice()
+        return zip(self._types[page], self._names[page], self._uuids[page])
+
+    def get_xml_element(self, with_items=True):
+        group = E.Group(E.UUID(self.uuid),
+                        E.Name(self.name),
+                        E.Notes(""),
+                        E.IconID(self.icon_id),
+                        get_xml_times(),
+                        E.IsExpanded("True"),
+                        E.DefaultAutoTypeSequence(""),
+                        E.EnableAutoType("null"),
+                        E.EnableSearching("null"),
+                        E.LastTopVisibleEntry("AAAAAAAAAAAAAAAAAAAAAA=="))
+        if with_items:
+            group.extend([item.get_xml_element() for item in self.items])
 
         return group
 
     def delete(self):
         self.deactivate()
-        self._parent.items.remove(self)
-        self._root.update_kdb_in_db()
+        self._parent.remove(self)
+        self._root.unregister_item(self)
+        self._root.update_kdb_in_db(removed=[self])
 
 
 class KeeEntry(BaseKeePass):
+    __slots__ = ('uuid', 'icon_id', 'items', 'autotype')
 
-    def __init__(self, root, parent, autotype, icond_id='0', uuid=""):
+    def __init__(self, root, parent, autotype, icond_id='0', uuid=None):
         super().__init__(root, parent)
         if not uuid:
-            self.uuid = (base64.b64encode(uuid_generator.uuid4().bytes)).decode("utf-8")
+            self.uuid = new_uuid()
         else:
             self.uuid = uuid
         self.type = ItemType.ENTRY
         self.icon_id = int(icond_id)
         self.items = []
         self.size = 0
-        self.name = ""
         self.autotype = autotype
 
     def __str__(self):
@@ -616,9 +801,9 @@ class KeeEntry(BaseKeePass):
             raise TypeError("KeeEntry accepts only EntryString items")
         self.items.append(item)
         self.size += 1
-        # also set name
+        # also set name, strings are appended before entry itself goes to group
         if item.key == "Title":
-            self.name = item.value
+            self._name = item.value
 
     def update_item(self, key, value):
         if key is None:
@@ -635,84 +820,48 @@ class KeeEntry(BaseKeePass):
                 return item
 
     def get_xml_element(self):
-        entry = Element("Entry")
-
-        uuid_el = SubElement(entry, 'UUID')
-        uuid_el.text = self.uuid
-
-        icon_id = SubElement(entry, 'IconID')
-        icon_id.text = str(self.icon_id)
-
-        SubElement(entry, "ForegroundColor")
-        SubElement(entry, "BackgroundColor")
-        SubElement(entry, "OverrideURL")
-        SubElement(entry, "Tags")
-
-        # ------Times
-        times = SubElement(entry, "Times")
-
-        nowdate = datetime.datetime.now()
-
-        cr_time = SubElement(times, "CreationTime")
-        cr_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        lm_time = SubElement(times, "LastModificationTime")
-        lm_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        la_time = SubElement(times, "LastAccessTime")
-        la_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        et_time = SubElement(times, "ExpiryTime")
-        et_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        expires = SubElement(times, "Expires")
-        expires.text = "False"
-
-        usage_count = SubElement(times, "UsageCount")
-        usage_count.text = "0"
-
-        lch_time = SubElement(times, "LocationChanged")
-        lch_time.text = nowdate.strftime("%Y-%m-%dT%H:%M:%SZ")
-        # Times-------------------
-
-        # Strings ----------
-        for item in self.items:
-            entry.append(item.get_xml_element())
-
-        # Autotype -----------
-        entry.append(self.autotype.get_xml_element())
-
-        SubElement(entry, "History")
-
-        return entry
+        return E.Entry(E.UUID(self.uuid),
+                       E.IconID(self.icon_id),
+                       E.ForegroundColor(),
+                       E.BackgroundColor(),
+                       E.OverrideURL(),
+                       E.Tags(),
+                       get_xml_times(),
+                       *[item.get_xml_element() for item in self.items],
+                       self.autotype.get_xml_element(),
+                       E.History())
 
     def delete(self):
         self.deactivate()
-        self._parent.items.remove(self)
-        self._root.update_kdb_in_db()
+        self._parent.remove(self)
+        self._root.unregister_item(self)
+        self._root.update_kdb_in_db(removed=[self])
 
 
 class EntryString(BaseKeePass):
+    __slots__ = ('key', '_value')
 
     def __init__(self, root, parent, key, value=None):
         super().__init__(root, parent)
         self.key = key
-        self.value = value
+        self._value = value
         self.type = ItemType.STRING
 
-        if key == "Title":
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if value == self._value:
+            return
+        self._value = value
+        if self.key == "Title":
             self._parent.name = value
+        self._parent.mark_dirty()
 
     def get_xml_element(self):
-        string = Element('String')
-
-        key_el = SubElement(string, 'Key')
-        key_el.text = self.key
-
-        value_el = SubElement(string, 'Value')
-        value_el.text = self.value
-
-        return string
+        return E.String(E.Key(self.key), E.Value(self.value))
 
     def __str__(self):
         if not self.value:
@@ -720,13 +869,9 @@ class EntryString(BaseKeePass):
         else:
             return self.key + " = " + self.value
 
-    def __setattr__(self, name, value):
-        if hasattr(self, 'key') and self.key == "Title":
-            self._parent.name = value
-        super().__setattr__(name, value)
-
 
 class AutoType():
+    __slots__ = ('enabled', 'dto', 'association', 'type')
 
     def __init__(self, enabled, dto='0', association=None):
         self.enabled = enabled
@@ -735,21 +880,9 @@ class AutoType():
         self.type = ItemType.AUTOTYPE
 
     def get_xml_element(self):
-        # Autotype -----------
-        autotype = Element("AutoType")
-        at_enabled = SubElement(autotype, "Enabled")
-        at_enabled.text = self.enabled
-
-        at_data_transfer_obfuscation = SubElement(autotype, "DataTransferObfuscation")
-        at_data_transfer_obfuscation.text = self.dto
-
+        children = [E.Enabled(self.enabled), E.DataTransferObfuscation(self.dto)]
         if self.association:
-            asoc = SubElement(autotype, "Association")
-
-            window = SubElement(asoc, "Window")
-            window.text = self.association['window']
-
-            key_sec = SubElement(asoc, "KeystrokeSequence")
-            key_sec.text = self.association['key_sec']
+            children.append(E.Association(E.Window(self.association['window']),
+                                          E.KeystrokeSequence(self.association['key_sec'])))
 
-        return autotype
+        return E.AutoType(*children)
@@ -13,7 +13,8 @@ from src.handlers.open import *
 from src.handlers.resend import *
 from src.handlers.search import *
 from src.handlers.start import *
-from src.models import User
+from src.lib.db import get_user
+from src.models import User, DBSession
 from src.settings import BOT_TOKEN, exm_mark_emo, DISTRIBUTION_COMMAND
 
 logger = logging.getLogger(__name__)
@@ -27,7 +28,7 @@ def error(bot, update, error):
 
 
 def stop(bot, update):
-    user = DBSession.query(User).filter(User.chat_id == update.message.chat_id).first()
+    user = get_user(update.message.chat_id)
 
     if user:
         DBSession.delete(user)
@@ -1,11 +1,11 @@
 from telegram.ext import BaseFilter
 
-from src.models import User, DBSession
+from src.lib.db import get_user
 
 
 class IsUserInCreateState(BaseFilter):
     def filter(self, message):
-        user = DBSession.query(User).filter(User.chat_id == message.chat_id).first()
+        user = get_user(message.chat_id)
         return user.create_state
 
 
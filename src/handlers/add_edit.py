@@ -3,15 +3,14 @@ import logging
 import telegram
 
 from src.KeePass import ItemType
-from src.lib.db import save_object
-from src.models import DBSession, User
+from src.lib.db import get_user, save_object
 from src.settings import opened_databases
 
 logger = logging.getLogger(__name__)
 
 
 def add_edit_query(bot, update):
-    user = DBSession.query(User).filter(User.chat_id == update.callback_query.message.chat_id).first()
+    user = get_user(update.callback_query.message.chat_id)
     data = update.callback_query.data.replace("create_", "")
     keepass = opened_databases[user.chat_id]
 
@@ -75,7 +74,7 @@ def add_edit_query(bot, update):
 
 
 def message_in_add_edit(bot, update):
-    user = DBSession.query(User).filter(User.chat_id == update.message.chat_id).first()
+    user = get_user(update.message.chat_id)
     text = update.message.text
     keepass = opened_databases[user.chat_id]
 
@@ -110,7 +109,7 @@ def create(bot, update):
     else:
         chat_id = update.callback_query.message.chat_id
 
-    user = DBSession.query(User).filter(User.chat_id == chat_id).first()
+    user = get_user(chat_id)
 
     args = update.message.text.replace('/create ', '')
     keepass = opened_databases[user.chat_id]
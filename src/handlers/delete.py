@@ -1,9 +1,8 @@
-from src.lib.db import save_object
-from src.models import DBSession, User
+from src.lib.db import get_user, save_object
 
 
 def delete_database(bot, update):
-    user = DBSession.query(User).filter(User.chat_id == update.message.chat_id).first()
+    user = get_user(update.message.chat_id)
 
     if user.is_opened:
         bot.send_message(chat_id=user.chat_id, text="Your database in use, first close it with \"/close\"")
@@ -1,6 +1,6 @@
 from io import BytesIO
 
-from src.models import DBSession, User
+from src.lib.db import get_user
 from src.settings import opened_databases, exm_mark_emo
 
 
@@ -10,7 +10,7 @@ def download_db(bot, update):
     else:
         chat_id = update.callback_query.message.chat_id
 
-    user = DBSession.query(User).filter(User.chat_id == chat_id).first()
+    user = get_user(chat_id)
 
     try:
         keepass = opened_databases[user.chat_id]
@@ -1,8 +1,7 @@
 import logging
 
-from src.lib.db import save_object
+from src.lib.db import get_user, save_object
 from src.lib.decorators import need_user
-from src.models import DBSession, User
 from src.settings import opened_databases
 
 logger = logging.getLogger(__name__)
@@ -15,7 +14,7 @@ def resend_interface(bot, update):
     else:
         chat_id = update.callback_query.message.chat_id
 
-    user = DBSession.query(User).filter(User.chat_id == chat_id).first()
+    user = get_user(chat_id)
 
     try:
         keepass = opened_databases[user.chat_id]
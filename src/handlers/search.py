@@ -1,4 +1,4 @@
-from src.models import DBSession, User
+from src.lib.db import get_user
 from src.settings import opened_databases
 
 
@@ -8,7 +8,7 @@ def search(bot, update):
     else:
         chat_id = update.callback_query.message.chat_id
 
-    user = DBSession.query(User).filter(User.chat_id == chat_id).first()
+    user = get_user(chat_id)
 
     try:
         keepass = opened_databases[user.chat_id]
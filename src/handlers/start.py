@@ -9,7 +9,7 @@ from psycopg2 import IntegrityError
 
 from src.handlers.conv import conv_fallback, conv_success
 from src.handlers.resend import resend_interface
-from src.lib.db import save_object
+from src.lib.db import get_user, save_object
 from src.lib.decorators import need_user
 from src.models import User, DBSession
 from src.settings import TEMP_FOLDER, exm_mark_emo, opened_databases
@@ -29,7 +29,7 @@ open_markup = InlineKeyboardMarkup([[InlineKeyboardButton('Yes', callback_data='
 
 def start_entry(bot, update, user_data):
 
-    user = DBSession.query(User).filter(User.chat_id == update.message.chat_id).first()
+    user = get_user(update.message.chat_id)
     if user is None:
         user = DBSession.query(User).filter(User.name == f"@{update.message.from_user.username if update.message.from_user.username else ''}").first()
     if user is None:
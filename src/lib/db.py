@@ -1,13 +1,39 @@
 import logging
 
 from psycopg2._psycopg import IntegrityError
+from sqlalchemy import select, update, bindparam, inspect
 from sqlalchemy.exc import SQLAlchemyError
 
 from src.handlers.conv import conv_fallback
-from src.models import DBSession
+from src.models import DBSession, User
 
 logger = logging.getLogger(__name__)
 
+GET_USER_STATEMENT = select(User).where(User.chat_id == bindparam('chat_id')).limit(1)
+
+
+def get_user(chat_id):
+    return DBSession.execute(GET_USER_STATEMENT, {'chat_id': chat_id}).scalar_one_or_none()
+
+
+def update_object(object, **values):
+    """
+    Writing columns of object with single UPDATE statement, without ORM flush of whole object
+    :param object: mapped object with id column
+    :param values: column values to write
+    :return: None
+    """
+    model = type(object)
+    # identity key is kept on expired object, reading object.id would reload whole row with file blob
+    object_id = inspect(object).identity[0]
+    try:
+        DBSession.execute(update(model).where(model.id == object_id).values(**values))
+        DBSession.commit()
+    except (SQLAlchemyError, IntegrityError) as e:
+        DBSession.rollback()
+        logger.critical("Database error")
+        logger.debug(f"Error message:\n{str(e)}")
+
 
 def save_object(object, bot=None, update=None, user_data=None):
     try:
@@ -1,7 +1,7 @@
 import logging
 from functools import wraps
 
-from src.models import DBSession, User
+from src.lib.db import get_user
 
 logger = logging.getLogger(__name__)
 
@@ -11,7 +11,7 @@ def restricted(role):
         @wraps(func)
         def wrapped(bot, update, *args, **kwargs):
             if update.message:
-                user = DBSession.query(User).filter(User.chat_id == update.message.chat_id).first()
+                user = get_user(update.message.chat_id)
                 if user.role is not role:
                     logger.warning(f"Unauthorized access denied for {user.username if user.username else 'Someone'} with id {user.id} when accessing {func.__name__}")
                     bot.send_message(chat_id=update.message.chat_id, text="Извините, неверная комманда.")
@@ -38,7 +38,7 @@ def need_user(func):
                 else:
                     chat_id = update.callback_query.message.chat_id
 
-                user_data['user'] = DBSession.query(User).filter(User.chat_id == chat_id).first()
+                user_data['user'] = get_user(chat_id)
 
         return func(bot, update, *args, **kwargs)
     return wrapped
\ No newline at end of file
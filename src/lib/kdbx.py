@@ -0,0 +1,95 @@
+import logging
+
+import libkeepass
+import libkeepass.crypto
+import libkeepass.kdb3
+import libkeepass.kdb4
+from libkeepass.crypto import sha256
+from libkeepass.kdb4 import KDB4Reader, KDB4_SIGNATURE
+from lxml import etree
+
+from src.settings import USE_OPENSSL_AES
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    default_backend = None
+
+logger = logging.getLogger(__name__)
+
+AES_BLOCK_SIZE = 16
+TRANSFORM_CHUNK_ROUNDS = 65536
+
+
+class CompactXmlKDB4Reader(KDB4Reader):
+    """
+    KDB4 reader which writes xml without indentation.
+    libkeepass serializes element tree for write_to() through pretty_print(),
+    indentation there only adds bytes to compress and encrypt.
+    """
+
+    def pretty_print(self):
+        """libkeepass serialization hook, overridden to skip pretty printing"""
+        return etree.tostring(self.obj_root, encoding='utf-8', standalone=True)
+
+
+class CachedKeyKDB4Reader(CompactXmlKDB4Reader):
+    """
+    KDB4 reader which runs key transformation only once per opened database.
+    Header seeds are not changed on write, so master key stays the same until credentials change.
+    """
+
+    def _make_master_key(self):
+        key_source = (tuple(self.keys), self.header.MasterSeed, self.header.TransformSeed, self.header.TransformRounds)
+        if getattr(self, '_master_key_source', None) != key_source:
+            super()._make_master_key()
+            self._master_key_source = key_source
+
+
+def openssl_transform_key(key, seed, rounds):
+    """
+    Same as libkeepass transform_key, but with OpenSSL AES.
+    CBC over zero blocks with key block as IV gives E(E(...E(block))),
+    so every chunk of rounds is a single OpenSSL call.
+    """
+    transformed = b''
+    for offset in range(0, len(key), AES_BLOCK_SIZE):
+        block = key[offset:offset + AES_BLOCK_SIZE]
+        encryptor = Cipher(algorithms.AES(seed), modes.CBC(block), backend=_backend).encryptor()
+        rounds_left = rounds
+        while rounds_left > 0:
+            chunk_rounds = min(rounds_left, TRANSFORM_CHUNK_ROUNDS)
+            block = encryptor.update(_zero_blocks[:chunk_rounds * AES_BLOCK_SIZE])[-AES_BLOCK_SIZE:]
+            rounds_left -= chunk_rounds
+        transformed += block
+    return sha256(transformed)
+
+
+def openssl_aes_cbc_decrypt(data, key, enc_iv):
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(enc_iv), backend=_backend).decryptor()
+    return decryptor.update(data) + decryptor.finalize()
+
+
+def openssl_aes_cbc_encrypt(data, key, enc_iv):
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(enc_iv), backend=_backend).encryptor()
+    return encryptor.update(data) + encryptor.finalize()
+
+
+libkeepass.add_kdb_reader(KDB4_SIGNATURE[1], CachedKeyKDB4Reader)
+
+if USE_OPENSSL_AES and default_backend is not None:
+    _backend = default_backend()
+    _zero_blocks = memoryview(bytes(TRANSFORM_CHUNK_ROUNDS * AES_BLOCK_SIZE))
+
+    """libkeepass modules import crypto functions by name, so replace them everywhere"""
+    for module in (libkeepass.crypto, libkeepass.kdb3, libkeepass.kdb4):
+        for name, func in (('transform_key', openssl_transform_key),
+                           ('aes_cbc_decrypt', openssl_aes_cbc_decrypt),
+                           ('aes_cbc_encrypt', openssl_aes_cbc_encrypt)):
+            if hasattr(module, name):
+                setattr(module, name, func)
+
+    logger.info(f"KeePass AES backend: {_backend.openssl_version_text()}")
+else:
+    logger.info("KeePass AES backend: libkeepass default")
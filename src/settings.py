@@ -1,5 +1,5 @@
 import logging.config
-from os import path, mkdir
+from os import path, mkdir, environ
 
 from emoji import emojize
 
@@ -12,6 +12,8 @@ ADMINISTRATOR = None
 DISTRIBUTION_COMMAND = None
 DISTRIBUTION_STOP_COMMAND = None
 DISTRIBUTION_DELAY = 60
+# AES-KDF rounds through OpenSSL (AES-NI), set KEEPASSBOT_DISABLE_AESNI=1 (true, yes) to use libkeepass default
+USE_OPENSSL_AES = environ.get('KEEPASSBOT_DISABLE_AESNI', '').strip().lower() not in ('1', 'true', 'yes')
 plus_emo = emojize(":heavy_plus_sign:", use_aliases=True)
 minus_emo = emojize(":heavy_minus_sign:", use_aliases=True)
 key_emo = emojize(":key:", use_aliases=True)